@@ -1,14 +1,19 @@
+
 import logging
-from typing import Dict, List
-from transformers import pipeline
-import torch
+from typing import Dict, List, Optional, Set, Tuple
+
+import ahocorasick
+import numpy as np
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from embedding_model import load_embeddings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class DocumentClassifier:
-    """Classifies documents using zero-shot classification."""
+    """Classifies documents using keyword votes with an embedding similarity fallback."""
 
     DOCUMENT_TYPES = [
         "Invoice",
@@ -18,24 +23,57 @@ class DocumentClassifier:
         "Unclassifiable"
     ]
 
-    def __init__(self, model_name: str = "facebook/bart-large-mnli"):
-        """
-        Initialize the classifier with a zero-shot model.
+    KEYWORDS = {
+        "Invoice": [
+            'invoice', 'invoice number', 'invoice #', 'bill to',
+            'total amount', 'amount due', 'payment terms', 'subtotal',
+            'tax', 'vat', 'due date'
+        ],
+        "Resume": [
+            'resume', 'curriculum vitae', 'cv', 'experience',
+            'education', 'skills', 'objective', 'professional summary',
+            'work history', 'employment', 'qualifications'
+        ],
+        "Utility Bill": [
+            'utility', 'electric', 'electricity', 'gas', 'water',
+            'kwh', 'kilowatt', 'meter', 'usage', 'service address',
+            'account number', 'billing period', 'current charges'
+        ],
+    }
 
-        Args:
-            model_name: Hugging Face model to use for classification
-        """
-        logger.info(f"Loading classification model: {model_name}")
+    # Minimum keyword hits for a class to win without consulting the embedding model
+    KEYWORD_THRESHOLD = 3
 
-        device = 0 if torch.cuda.is_available() else -1
+    # Minimum cosine similarity to a label prototype before falling back to "Other"
+    SIMILARITY_THRESHOLD = 0.3
 
-        self.classifier = pipeline(
-            "zero-shot-classification",
-            model=model_name,
-            device=device
-        )
+    def __init__(
+        self,
+        embeddings: Optional[HuggingFaceEmbeddings] = None,
+        model_name: str = "all-MiniLM-L6-v2"
+    ):
+        """
+        Initialize the classifier and precompute label prototype embeddings.
 
-        self.hypothesis_template = "This document is a {}."
+        Args:
+            embeddings: Already-loaded embedding model to reuse (e.g. SemanticRetrieval.embeddings)
+            model_name: Sentence transformer model to load when no embeddings are given
+        """
+        self.embeddings = embeddings if embeddings is not None else load_embeddings(model_name)
+
+        # One automaton over every keyword finds all of them in a single pass
+        self.keyword_automaton = ahocorasick.Automaton()
+        for label, keywords in self.KEYWORDS.items():
+            for kw in keywords:
+                self.keyword_automaton.add_word(kw, (label, kw))
+        self.keyword_automaton.make_automaton()
+
+        self.labels = list(self.KEYWORDS)
+        prototypes = [
+            f"This document is a {label}. " + ", ".join(keywords)
+            for label, keywords in self.KEYWORDS.items()
+        ]
+        self.label_embeddings = self._normalize(np.array(self.embeddings.embed_documents(prototypes)))
 
         logger.info("Classifier initialized successfully")
 
@@ -55,26 +93,12 @@ class DocumentClassifier:
             return "Unclassifiable"
 
         try:
-            text_sample = text[:2000]
-
-            result = self.classifier(
-                text_sample,
-                candidate_labels=self.DOCUMENT_TYPES,
-                hypothesis_template=self.hypothesis_template,
-                multi_label=False
-            )
-
-            predicted_class = result['labels'][0]
-            confidence = result['scores'][0]
-
-            logger.info(f"{filename}: {predicted_class} (confidence: {confidence:.2f})")
-
-            if confidence < 0.3:
-                return "Unclassifiable"
+            keyword_class = self._classify_by_keywords(text, filename)
+            if keyword_class:
+                return keyword_class
 
-            predicted_class = self._apply_rules(text, predicted_class, confidence)
-
-            return predicted_class
+            embedding = np.array([self.embeddings.embed_query(text[:2000])])
+            return self._classify_by_similarity(embedding, [filename])[0]
 
         except Exception as e:
             logger.error(f"Classification failed for {filename}: {e}")
@@ -90,67 +114,118 @@ class DocumentClassifier:
         Returns:
             Dictionary mapping filenames to document types
         """
-        classifications = {}
+        return self.classify_batch_with_failures(documents)[0]
 
-        for filename, text in documents.items():
-            doc_type = self.classify(text, filename)
-            classifications[filename] = doc_type
+    def classify_batch_with_failures(self, documents: Dict[str, str]) -> Tuple[Dict[str, str], Set[str]]:
+        """
+        Classify multiple documents and report which ones hit an error.
 
-        return classifications
+        Args:
+            documents: Dictionary mapping filenames to document text
 
-    def _apply_rules(self, text: str, predicted_class: str, confidence: float) -> str:
+        Returns:
+            Tuple of (dictionary mapping filenames to document types,
+            filenames marked Unclassifiable because the embedding fallback failed)
         """
-        Apply rule-based refinements to improve classification accuracy.
+        classifications = {}
+        fallback = {}
+        failed = set()
+
+        for filename, text in documents.items():
+            if not text or len(text.strip()) < 10:
+                logger.warning(f"Insufficient text for classification: {filename}")
+                classifications[filename] = "Unclassifiable"
+                continue
+
+            keyword_class = self._classify_by_keywords(text, filename)
+            if keyword_class:
+                classifications[filename] = keyword_class
+            else:
+                fallback[filename] = text
+
+        if fallback:
+            try:
+                # Embed every undecided document in one batched forward pass
+                texts = [text[:2000] for text in fallback.values()]
+                embeddings = np.array(self.embeddings.embed_documents(texts))
+                predicted = self._classify_by_similarity(embeddings, list(fallback))
+            except Exception as e:
+                logger.error(f"Batch classification failed: {e}")
+                predicted = ["Unclassifiable"] * len(fallback)
+                failed.update(fallback)
+
+            classifications.update(zip(fallback, predicted))
+
+        return {filename: classifications[filename] for filename in documents}, failed
+
+    def _count_keywords(self, text: str) -> Dict[str, int]:
+        """
+        Count how many keywords of each document type occur in the text.
 
         Args:
             text: Document text
-            predicted_class: Predicted class from the model
-            confidence: Confidence score
 
         Returns:
-            Refined document class
+            Dictionary mapping document types to keyword hit counts
         """
         text_lower = text.lower()
 
-        invoice_keywords = [
-            'invoice', 'invoice number', 'invoice #', 'bill to',
-            'total amount', 'amount due', 'payment terms', 'subtotal',
-            'tax', 'vat', 'due date'
-        ]
+        # Keywords can occur many times; each one counts once toward its type
+        found = {match for _, match in self.keyword_automaton.iter(text_lower)}
 
-        resume_keywords = [
-            'resume', 'curriculum vitae', 'cv', 'experience',
-            'education', 'skills', 'objective', 'professional summary',
-            'work history', 'employment', 'qualifications'
-        ]
+        counts = {label: 0 for label in self.KEYWORDS}
+        for label, _ in found:
+            counts[label] += 1
 
-        utility_keywords = [
-            'utility', 'electric', 'electricity', 'gas', 'water',
-            'kwh', 'kilowatt', 'meter', 'usage', 'service address',
-            'account number', 'billing period', 'current charges'
-        ]
+        return counts
+
+    def _classify_by_keywords(self, text: str, filename: str = "") -> Optional[str]:
+        """
+        Pick the document type with the most keyword hits, if it is decisive.
+
+        Args:
+            text: Document text
+            filename: Optional filename for logging
+
+        Returns:
+            Document type, or None when no type reaches KEYWORD_THRESHOLD
+        """
+        counts = self._count_keywords(text)
+        best_class = max(counts, key=counts.get)
 
-        invoice_count = sum(1 for kw in invoice_keywords if kw in text_lower)
-        resume_count = sum(1 for kw in resume_keywords if kw in text_lower)
-        utility_count = sum(1 for kw in utility_keywords if kw in text_lower)
+        if counts[best_class] >= self.KEYWORD_THRESHOLD:
+            logger.info(f"{filename}: {best_class} (found {counts[best_class]} keywords)")
+            return best_class
 
-        if invoice_count >= 3 and predicted_class != "Invoice":
-            logger.info(f"Rule override: Changing to Invoice (found {invoice_count} keywords)")
-            return "Invoice"
+        return None
 
-        if resume_count >= 3 and predicted_class != "Resume":
-            logger.info(f"Rule override: Changing to Resume (found {resume_count} keywords)")
-            return "Resume"
+    def _classify_by_similarity(self, embeddings: np.ndarray, filenames: List[str]) -> List[str]:
+        """
+        Assign each embedding to the closest label prototype by cosine similarity.
 
-        if utility_count >= 3 and predicted_class != "Utility Bill":
-            logger.info(f"Rule override: Changing to Utility Bill (found {utility_count} keywords)")
-            return "Utility Bill"
+        Args:
+            embeddings: Document embeddings, one row per document
+            filenames: Filenames matching the embedding rows, for logging
+
+        Returns:
+            Document types, one per embedding row
+        """
+        similarities = self._normalize(embeddings) @ self.label_embeddings.T
 
-        if confidence < 0.5 and max(invoice_count, resume_count, utility_count) < 2:
-            return "Other"
+        predicted = []
+        for filename, scores in zip(filenames, similarities):
+            best = int(np.argmax(scores))
+            predicted_class = self.labels[best]
+            confidence = float(scores[best])
 
-        return predicted_class
+            logger.info(f"{filename}: {predicted_class} (similarity: {confidence:.2f})")
 
+            predicted.append(predicted_class if confidence >= self.SIMILARITY_THRESHOLD else "Other")
 
-classifier = DocumentClassifier()
+        return predicted
 
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize embedding rows so dot products are cosine similarities."""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
@@ -1,20 +1,24 @@
 import os
 import re
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
-from langchain_community.document_loaders import PyMuPDFLoader
+import fitz
+
+from text_utils import leading_lines
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class DocumentProcessor:
-    """Extracts and cleans text from PDF documents using LangChain PyMuPDFLoader."""
+    """Extracts and cleans text from PDF documents using PyMuPDF."""
 
     def __init__(self):
         self.supported_extensions = {'.pdf'}
+        self._disallowed_pattern = re.compile(r'[^\w\s@.$,;:()\-\/]+')
 
     def process_folder(self, folder_path: str) -> Dict[str, str]:
         """
@@ -33,20 +37,32 @@ class DocumentProcessor:
 
         logger.info(f"Found {len(files)} documents to process")
 
-        for file_path in files:
-            try:
-                text = self.extract_text(str(file_path))
-                documents[file_path.name] = text
-                logger.info(f"Successfully processed: {file_path.name}")
-            except Exception as e:
-                logger.error(f"Failed to process {file_path.name}: {e}")
-                documents[file_path.name] = ""
+        if not files:
+            return documents
+
+        # PDF parsing and cleaning are CPU bound and independent per file,
+        # so spread them across processes instead of threads
+        max_workers = min(len(files), os.cpu_count() or 1)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                file_path.name: executor.submit(self.extract_text, str(file_path))
+                for file_path in files
+            }
+
+            for name, future in futures.items():
+                try:
+                    documents[name] = future.result()
+                    logger.info(f"Successfully processed: {name}")
+                except Exception as e:
+                    logger.error(f"Failed to process {name}: {e}")
+                    documents[name] = ""
 
         return documents
 
     def extract_text(self, file_path: str) -> str:
         """
-        Extract text from a PDF document using LangChain PyMuPDFLoader.
+        Extract text from a PDF document using PyMuPDF.
 
         Args:
             file_path: Path to the PDF document
@@ -59,44 +75,62 @@ class DocumentProcessor:
         if path.suffix.lower() != '.pdf':
             raise ValueError(f"Unsupported file type: {path.suffix}. Only PDF files are supported.")
 
-        return self._extract_from_pdf(file_path)
+        _, text = self._extract_from_pdf(file_path)
+        return text
 
-    def _extract_from_pdf(self, file_path: str) -> str:
+    def extract_from_bytes(self, content: bytes, filename: str = "") -> Tuple[List[str], str]:
         """
-        Extract text from PDF using LangChain PyMuPDFLoader.
+        Extract text from an in-memory PDF without writing it to disk first.
+
+        Args:
+            content: Raw PDF bytes
+            filename: Optional filename for logging
+
+        Returns:
+            Tuple of the document's first lines (cleaned individually) and the cleaned text
+        """
+        return self._extract_from_pdf(filename, stream=content)
+
+    def _extract_from_pdf(self, file_path: str, stream: Optional[bytes] = None) -> Tuple[List[str], str]:
+        """
+        Extract text from PDF page by page using PyMuPDF.
+
+        Reads from stream when given, otherwise from file_path.
         """
         try:
-            loader = PyMuPDFLoader(file_path)
-            documents = loader.load()
+            if stream is not None:
+                doc = fitz.open(stream=stream, filetype="pdf")
+            else:
+                doc = fitz.open(file_path)
 
-            text_parts = [doc.page_content for doc in documents]
-            text = "\n".join(text_parts)
+            with doc:
+                text = "\n".join(page.get_text("text") for page in doc)
 
             return self._clean_text(text)
         except Exception as e:
-            logger.error(f"PyMuPDFLoader failed for {file_path}: {e}")
-            return ""
+            logger.error(f"PyMuPDF failed for {file_path}: {e}")
+            return [], ""
 
-    def _clean_text(self, text: str) -> str:
+    def _clean_text(self, text: str) -> Tuple[List[str], str]:
         """
         Clean and normalize extracted text.
 
+        Cleaning joins everything into one line, so the first lines are
+        captured beforehand for line-based heuristics such as name detection.
+
         Args:
             text: Raw extracted text
 
         Returns:
-            Cleaned text
+            Tuple of the first 5 lines (each cleaned) and the cleaned text
         """
-        text = re.sub(r'\s+', ' ', text)
-
-        text = re.sub(r'[^\w\s@.$,;:()\-\/]', '', text)
-
-        text = text.replace('\n', ' ').replace('\r', ' ')
-
-        text = re.sub(r' +', ' ', text)
-
-        return text.strip()
+        first_lines = [self._clean_line(line) for line in leading_lines(text)]
 
+        return first_lines, self._clean_line(text)
 
-processor = DocumentProcessor()
+    def _clean_line(self, text: str) -> str:
+        """Drop disallowed characters and collapse whitespace."""
+        text = self._disallowed_pattern.sub('', text)
 
+        # Collapse every whitespace run to one space and trim the ends
+        return ' '.join(text.split())
@@ -0,0 +1,47 @@
+import logging
+
+import torch
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_embeddings(model_name: str = "all-MiniLM-L6-v2", quantize: bool = False) -> HuggingFaceEmbeddings:
+    """
+    Load a sentence transformer prepared for inference.
+
+    Args:
+        model_name: Sentence transformer model to load
+        quantize: Apply int8 dynamic quantization to the model's linear layers on CPU.
+            Off by default: it shifts similarity scores, and the classifier's
+            SIMILARITY_THRESHOLD was tuned on fp32 embeddings
+
+    Returns:
+        Embeddings returning normalized vectors
+    """
+    logger.info(f"Loading embedding model: {model_name}")
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': device},
+        encode_kwargs={'batch_size': 64, 'normalize_embeddings': True, 'convert_to_numpy': True}
+    )
+
+    if quantize and device == 'cpu':
+        # int8 weights for every nn.Linear; activations are quantized on the fly per batch
+        embeddings.client = torch.ao.quantization.quantize_dynamic(
+            embeddings.client,
+            {torch.nn.Linear},
+            dtype=torch.qint8
+        )
+        logger.info("Applied int8 dynamic quantization to embedding model")
+
+    # The model is only used for inference; skip autograd tracking on every encode
+    model = embeddings.client
+    model.eval()
+    model.encode = torch.inference_mode()(model.encode)
+
+    return embeddings
@@ -1,7 +1,10 @@
 import re
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+
+from text_utils import leading_lines
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -16,59 +19,75 @@ class DataExtractor:
     def _compile_patterns(self):
         """Compile all regex patterns used for extraction."""
         self.invoice_number_patterns = [
-            r'invoice\s*#?\s*:?\s*([A-Z0-9\-]+)',
-            r'inv\s*#?\s*:?\s*([A-Z0-9\-]+)',
-            r'invoice\s*number\s*:?\s*([A-Z0-9\-]+)',
+            re.compile(r'invoice\s*#?\s*:?\s*([A-Z0-9\-]+)', re.IGNORECASE),
+            re.compile(r'inv\s*#?\s*:?\s*([A-Z0-9\-]+)', re.IGNORECASE),
+            re.compile(r'invoice\s*number\s*:?\s*([A-Z0-9\-]+)', re.IGNORECASE),
         ]
 
         self.date_patterns = [
-            r'\d{4}-\d{2}-\d{2}',  
-            r'\d{2}/\d{2}/\d{4}',  
-            r'\d{2}-\d{2}-\d{4}',  
-            r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4}',  # Month DD, YYYY
+            re.compile(r'\d{4}-\d{2}-\d{2}', re.IGNORECASE),
+            re.compile(r'\d{2}/\d{2}/\d{4}', re.IGNORECASE),
+            re.compile(r'\d{2}-\d{2}-\d{4}', re.IGNORECASE),
+            re.compile(r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4}', re.IGNORECASE),  # Month DD, YYYY
         ]
 
         self.amount_patterns = [
-            r'total\s*amount\s*:?\s*\$?\s*([\d,]+\.?\d*)',
-            r'amount\s*due\s*:?\s*\$?\s*([\d,]+\.?\d*)',
-            r'total\s*:?\s*\$?\s*([\d,]+\.?\d*)',
-            r'grand\s*total\s*:?\s*\$?\s*([\d,]+\.?\d*)',
+            re.compile(r'total\s*amount\s*:?\s*\$?\s*([\d,]+\.?\d*)', re.IGNORECASE),
+            re.compile(r'amount\s*due\s*:?\s*\$?\s*([\d,]+\.?\d*)', re.IGNORECASE),
+            re.compile(r'total\s*:?\s*\$?\s*([\d,]+\.?\d*)', re.IGNORECASE),
+            re.compile(r'grand\s*total\s*:?\s*\$?\s*([\d,]+\.?\d*)', re.IGNORECASE),
         ]
 
-        self.email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+        self.email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
 
         self.phone_patterns = [
-            r'\+?\d{1,3}[-.\s]?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}',
-            r'\d{3}-\d{3}-\d{4}',
-            r'\(\d{3}\)\s*\d{3}-\d{4}',
+            re.compile(r'\+?\d{1,3}[-.\s]?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'),
+            re.compile(r'\d{3}-\d{3}-\d{4}'),
+            re.compile(r'\(\d{3}\)\s*\d{3}-\d{4}'),
         ]
 
-        self.account_number_pattern = r'account\s*number\s*:?\s*([A-Z0-9\-]+)'
+        self.account_number_pattern = re.compile(r'account\s*number\s*:?\s*([A-Z0-9\-]+)', re.IGNORECASE)
 
-        self.usage_pattern = r'(\d+\.?\d*)\s*kwh'
+        self.usage_pattern = re.compile(r'(\d+\.?\d*)\s*kwh')
 
         self.experience_patterns = [
-            r'(\d+)\s*\+?\s*years?\s*(?:of)?\s*experience',
-            r'experience\s*:?\s*(\d+)\s*\+?\s*years?',
+            re.compile(r'(\d+)\s*\+?\s*years?\s*(?:of)?\s*experience'),
+            re.compile(r'experience\s*:?\s*(\d+)\s*\+?\s*years?'),
         ]
 
-    def extract(self, text: str, doc_type: str) -> Dict[str, Any]:
+        # Company names rely on capitalization, so this pattern stays case-sensitive
+        self.company_pattern = re.compile(r'([A-Z][A-Za-z\s&]+(?:Inc|LLC|Ltd|Corporation|Corp|Company|Co)\.?)')
+
+        # Literals that every pattern of a field requires. A substring check is far
+        # cheaper than a regex sweep, so fields whose literals are absent are skipped.
+        self.invoice_number_keywords = ('inv',)
+        self.amount_keywords = ('total', 'amount')
+        self.account_number_keywords = ('account',)
+        self.usage_keywords = ('kwh',)
+        self.experience_keywords = ('experience',)
+        self.company_suffixes = ('Inc', 'LLC', 'Ltd', 'Co')
+
+    def extract(self, text: str, doc_type: str, first_lines: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Extract structured data based on document type.
 
         Args:
             text: Document text
             doc_type: Document classification (Invoice, Resume, etc.)
+            first_lines: Optional first lines of the document before cleaning joined them
 
         Returns:
             Dictionary with extracted fields
         """
+        # Lowercase once; every case-insensitive helper shares this copy
+        text_lower = text.lower()
+
         if doc_type == "Invoice":
-            return self._extract_invoice(text)
+            return self._extract_invoice(text, text_lower)
         elif doc_type == "Resume":
-            return self._extract_resume(text)
+            return self._extract_resume(text, text_lower, first_lines)
         elif doc_type == "Utility Bill":
-            return self._extract_utility_bill(text)
+            return self._extract_utility_bill(text, text_lower)
         else:
             return {}
 
@@ -94,11 +113,11 @@ class DataExtractor:
 
         return results
 
-    def _extract_invoice(self, text: str) -> Dict[str, Any]:
+    def _extract_invoice(self, text: str, text_lower: str) -> Dict[str, Any]:
         """Extract invoice-specific fields."""
         data = {}
 
-        invoice_number = self._extract_with_patterns(text, self.invoice_number_patterns)
+        invoice_number = self._extract_with_patterns(text_lower, self.invoice_number_patterns, self.invoice_number_keywords)
         if invoice_number:
             data['invoice_number'] = invoice_number.upper()
 
@@ -110,17 +129,17 @@ class DataExtractor:
         if company:
             data['company'] = company
 
-        amount = self._extract_amount(text)
+        amount = self._extract_amount(text_lower)
         if amount:
             data['total_amount'] = amount
 
         return data
 
-    def _extract_resume(self, text: str) -> Dict[str, Any]:
+    def _extract_resume(self, text: str, text_lower: str, first_lines: Optional[List[str]] = None) -> Dict[str, Any]:
         """Extract resume-specific fields."""
         data = {}
 
-        name = self._extract_name(text)
+        name = self._extract_name(text, first_lines)
         if name:
             data['name'] = name
 
@@ -132,17 +151,17 @@ class DataExtractor:
         if phone:
             data['phone'] = phone
 
-        experience = self._extract_experience_years(text)
+        experience = self._extract_experience_years(text_lower)
         if experience:
             data['experience_years'] = experience
 
         return data
 
-    def _extract_utility_bill(self, text: str) -> Dict[str, Any]:
+    def _extract_utility_bill(self, text: str, text_lower: str) -> Dict[str, Any]:
         """Extract utility bill-specific fields."""
         data = {}
 
-        account = self._extract_with_patterns(text, [self.account_number_pattern])
+        account = self._extract_with_patterns(text_lower, [self.account_number_pattern], self.account_number_keywords)
         if account:
             data['account_number'] = account.upper()
 
@@ -150,29 +169,35 @@ class DataExtractor:
         if date:
             data['date'] = date
 
-        usage = self._extract_usage(text)
+        usage = self._extract_usage(text_lower)
         if usage:
             data['usage_kwh'] = usage
 
-        amount = self._extract_amount(text)
+        amount = self._extract_amount(text_lower)
         if amount:
             data['amount_due'] = amount
 
         return data
 
-    def _extract_with_patterns(self, text: str, patterns: list) -> Optional[str]:
-        """Extract text using a list of regex patterns."""
-        text_lower = text.lower()
+    def _extract_with_patterns(self, text_lower: str, patterns: list, keywords: tuple = ()) -> Optional[str]:
+        """Extract text using a list of regex patterns, skipped if none of the keywords occur."""
+        if keywords and not self._contains_any(text_lower, keywords):
+            return None
         for pattern in patterns:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
+            match = pattern.search(text_lower)
             if match:
                 return match.group(1).strip()
         return None
 
+    @staticmethod
+    def _contains_any(text: str, keywords: tuple) -> bool:
+        """Check whether any keyword occurs in the text."""
+        return any(kw in text for kw in keywords)
+
     def _extract_date(self, text: str) -> Optional[str]:
         """Extract and normalize dates."""
         for pattern in self.date_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+            match = pattern.search(text)
             if match:
                 date_str = match.group(0)
                 normalized = self._normalize_date(date_str)
@@ -200,11 +225,12 @@ class DataExtractor:
                 continue
         return None
 
-    def _extract_amount(self, text: str) -> Optional[float]:
-        """Extract monetary amounts."""
-        text_lower = text.lower()
+    def _extract_amount(self, text_lower: str) -> Optional[float]:
+        """Extract monetary amounts from lowercased text."""
+        if not self._contains_any(text_lower, self.amount_keywords):
+            return None
         for pattern in self.amount_patterns:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
+            match = pattern.search(text_lower)
             if match:
                 amount_str = match.group(1).replace(',', '')
                 try:
@@ -216,16 +242,17 @@ class DataExtractor:
     def _extract_company_name(self, text: str) -> Optional[str]:
         """Extract company name using heuristics."""
         # Look for company suffixes
-        company_pattern = r'([A-Z][A-Za-z\s&]+(?:Inc|LLC|Ltd|Corporation|Corp|Company|Co)\.?)'
-        match = re.search(company_pattern, text)
+        if not self._contains_any(text, self.company_suffixes):
+            return None
+        match = self.company_pattern.search(text)
         if match:
             return match.group(1).strip()
         return None
 
-    def _extract_name(self, text: str) -> Optional[str]:
+    def _extract_name(self, text: str, first_lines: Optional[List[str]] = None) -> Optional[str]:
         """Extract person name (heuristic: first line with 2-3 capitalized words)."""
-        lines = text.split('\n')
-        for line in lines[:5]:  # Check first 5 lines
+        lines = first_lines if first_lines is not None else leading_lines(text)
+        for line in lines:  # Check first 5 lines
             words = line.strip().split()
             if 2 <= len(words) <= 4:
                 # Check if all words are capitalized
@@ -237,7 +264,9 @@ class DataExtractor:
 
     def _extract_email(self, text: str) -> Optional[str]:
         """Extract email address."""
-        match = re.search(self.email_pattern, text)
+        if '@' not in text:
+            return None
+        match = self.email_pattern.search(text)
         if match:
             return match.group(0)
         return None
@@ -245,16 +274,17 @@ class DataExtractor:
     def _extract_phone(self, text: str) -> Optional[str]:
         """Extract phone number."""
         for pattern in self.phone_patterns:
-            match = re.search(pattern, text)
+            match = pattern.search(text)
             if match:
                 return match.group(0)
         return None
 
-    def _extract_experience_years(self, text: str) -> Optional[int]:
-        """Extract years of experience."""
-        text_lower = text.lower()
+    def _extract_experience_years(self, text_lower: str) -> Optional[int]:
+        """Extract years of experience from lowercased text."""
+        if not self._contains_any(text_lower, self.experience_keywords):
+            return None
         for pattern in self.experience_patterns:
-            match = re.search(pattern, text_lower)
+            match = pattern.search(text_lower)
             if match:
                 try:
                     return int(match.group(1))
@@ -262,16 +292,14 @@ class DataExtractor:
                     continue
         return None
 
-    def _extract_usage(self, text: str) -> Optional[float]:
-        """Extract kWh usage from utility bills."""
-        text_lower = text.lower()
-        match = re.search(self.usage_pattern, text_lower)
+    def _extract_usage(self, text_lower: str) -> Optional[float]:
+        """Extract kWh usage from lowercased utility bill text."""
+        if not self._contains_any(text_lower, self.usage_keywords):
+            return None
+        match = self.usage_pattern.search(text_lower)
         if match:
             try:
                 return float(match.group(1))
             except ValueError:
                 pass
         return None
-
-
-extractor = DataExtractor()
@@ -1,8 +1,13 @@
 import os
+import asyncio
 import json,uvicorn
+import aiofiles
+import hashlib
 import logging
+from collections import OrderedDict
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from typing import Dict, List, Optional, Tuple
+from fastapi import BackgroundTasks, FastAPI, HTTPException, UploadFile, File
 from document_processor import DocumentProcessor
 from classifier import DocumentClassifier
 from extractor import DataExtractor
@@ -30,7 +35,12 @@ retrieval = None
 
 # Configuration
 INPUT_FOLDER = "data/input"
-OUTPUT_FILE = "output.json"
+OUTPUT_FILE = "output.jsonl"
+CACHE_SIZE = 256
+
+# Results of earlier uploads, keyed by text digest
+classification_cache: OrderedDict = OrderedDict()
+extraction_cache: OrderedDict = OrderedDict()
 
 
 @app.on_event("startup")
@@ -49,14 +59,18 @@ async def startup_event():
         logger.info("Loading document processor...")
         processor = DocumentProcessor()
 
-        logger.info("Loading classifier model...")
-        classifier = DocumentClassifier()
+        logger.info("Loading retrieval system...")
+        retrieval = SemanticRetrieval()
+
+        logger.info("Loading classifier...")
+        classifier = DocumentClassifier(embeddings=retrieval.embeddings)
 
         logger.info("Loading extractor...")
         extractor = DataExtractor()
 
-        logger.info("Loading retrieval system...")
-        retrieval = SemanticRetrieval()
+        # Run one document through the models so the first upload doesn't pay for initialization
+        logger.info("Warming up models...")
+        classifier.classify("warmup " * 50, "warmup")
 
         # Try to load existing index
         # retrieval.load_index()
@@ -69,8 +83,154 @@ async def startup_event():
 
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write any pending index changes to disk."""
+    if retrieval is not None:
+        await asyncio.to_thread(retrieval.flush)
+
+
+def text_digest(text: str) -> str:
+    """Return a content hash used to recognize repeated documents."""
+    return hashlib.blake2b(text.encode('utf-8')).hexdigest()
+
+
+def cache_get(cache: OrderedDict, key):
+    """Look up a cached value and mark it as recently used."""
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return cache[key]
+
+
+def cache_put(cache: OrderedDict, key, value):
+    """Store a value, evicting the least recently used entry when full."""
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def process_documents(
+    documents: Dict[str, str],
+    index_name: str,
+    first_lines: Optional[Dict[str, List[str]]] = None
+) -> List[dict]:
+    """
+    Classify, extract, and queue documents for indexing.
+
+    Classification is cached by text digest and extraction by digest and first
+    lines, so identical documents uploaded again skip both. The same file is
+    only embedded once per index.
+
+    Args:
+        documents: Dictionary mapping filenames to document text
+        index_name: Name of the index to store documents in
+        first_lines: Optional dictionary mapping filenames to their first lines
+
+    Returns:
+        Result dictionaries, one per document
+    """
+    first_lines = first_lines or {}
+    digests = {filename: text_digest(text) for filename, text in documents.items()}
+
+    classifications = {}
+    for filename in documents:
+        doc_type = cache_get(classification_cache, digests[filename])
+        if doc_type is not None:
+            classifications[filename] = doc_type
+
+    uncached = {filename: text for filename, text in documents.items() if filename not in classifications}
+    if uncached:
+        predicted, failed = classifier.classify_batch_with_failures(uncached)
+        for filename, doc_type in predicted.items():
+            # Errors are not cached so the document is retried on its next upload
+            if filename not in failed:
+                cache_put(classification_cache, digests[filename], doc_type)
+            classifications[filename] = doc_type
+
+    results = []
+    for filename, text in documents.items():
+        doc_type = classifications[filename]
+
+        # Name extraction reads the raw first lines, which cleaning does not preserve
+        lines = first_lines.get(filename)
+        extraction_key = (digests[filename], doc_type, tuple(lines) if lines is not None else None)
+
+        extracted_data = cache_get(extraction_cache, extraction_key)
+        if extracted_data is None:
+            extracted_data = extractor.extract(text, doc_type, lines)
+            cache_put(extraction_cache, extraction_key, extracted_data)
+
+        # Embedded together with other pending uploads; skipped if already indexed
+        retrieval.queue_document(index_name, filename, text, digests[filename])
+
+        results.append({
+            "filename": filename,
+            "index_name": index_name,
+            "class": doc_type,
+            **extracted_data
+        })
+
+    return results
+
+
+async def save_upload(path: Path, content: bytes):
+    """
+    Write an uploaded PDF to disk.
+
+    Args:
+        path: Destination path
+        content: Raw PDF bytes
+    """
+    async with aiofiles.open(path, 'wb') as f:
+        await f.write(content)
+
+
+async def save_results(results: List[dict]):
+    """
+    Append processing results to the output file, one JSON object per line.
+
+    Args:
+        results: Result dictionaries to store
+    """
+    lines = "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+
+    async with aiofiles.open(OUTPUT_FILE, 'a', encoding='utf-8') as f:
+        await f.write(lines)
+
+
+async def read_upload(background_tasks: BackgroundTasks, file: UploadFile) -> Tuple[List[str], str]:
+    """
+    Read an uploaded PDF, schedule saving it, and extract its text.
+
+    Args:
+        background_tasks: Tasks run after the response is sent
+        file: Uploaded PDF file
+
+    Returns:
+        Tuple of the document's first lines and its cleaned text
+    """
+    content = await file.read()
+
+    # Keep a copy of the upload on disk once the response has been sent
+    background_tasks.add_task(save_upload, Path(INPUT_FOLDER) / file.filename, content)
+
+    # Extract text straight from the uploaded bytes
+    lines, text = processor.extract_from_bytes(content, file.filename)
+
+    if not text:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to extract text from PDF: {file.filename}"
+        )
+
+    return lines, text
+
+
 @app.post("/upload", tags=["Processing"])
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     index_name: str = "default"
 ):
@@ -92,63 +252,113 @@ async def upload_document(
                 detail="Only PDF files are supported"
             )
 
-        # Save uploaded file temporarily
-        temp_path = Path(INPUT_FOLDER) / file.filename
-        with open(temp_path, 'wb') as f:
-            content = await file.read()
-            f.write(content)
-
         logger.info(f"Processing file: {file.filename} for index: {index_name}")
 
-        # Extract text
-        text = processor.extract_text(str(temp_path))
+        lines, text = await read_upload(background_tasks, file)
 
-        if not text:
-            raise HTTPException(
-                status_code=400,
-                detail="Failed to extract text from PDF"
-            )
+        # Classify, extract structured data, and queue for the search index
+        result = process_documents({file.filename: text}, index_name, {file.filename: lines})[0]
 
-        # Classify document
-        doc_type = classifier.classify(text, file.filename)
+        # Append to output.jsonl
+        await save_results([result])
 
-        # Extract structured data
-        extracted_data = extractor.extract(text, doc_type)
+        logger.info(f"Successfully processed: {file.filename}")
 
-        # Add to search index
-        retrieval.add_document(index_name, file.filename, text)
+        return result
 
-        # Prepare result
-        result = {
-            "filename": file.filename,
-            "index_name": index_name,
-            "class": doc_type,
-            **extracted_data
-        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing document: {e}")
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+
+@app.post("/batch_upload", tags=["Processing"])
+async def batch_upload_documents(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    index_name: str = "default"
+):
+    """
+    Upload and process several PDF documents at once.
+
+    Args:
+        files: PDF files to upload
+        index_name: Name of the index to store documents in
+
+    Returns:
+        Classification and extracted data for each document
+    """
+    try:
+        # Validate file types
+        for file in files:
+            if not file.filename.endswith('.pdf'):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Only PDF files are supported: {file.filename}"
+                )
 
-        # Save to output.json
-        try:
-            with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-                all_results = json.load(f)
-        except FileNotFoundError:
-            all_results = {}
+        documents = {}
+        first_lines = {}
+        for file in files:
+            lines, text = await read_upload(background_tasks, file)
+            documents[file.filename] = text
+            first_lines[file.filename] = lines
 
-        all_results[file.filename] = result
+        logger.info(f"Processing {len(documents)} files for index: {index_name}")
 
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_results, f, indent=2, ensure_ascii=False)
+        # Classify and extract structured data
+        results = process_documents(documents, index_name, first_lines)
 
-        logger.info(f"Successfully processed: {file.filename}")
+        # Index the whole batch with one embedding pass, off the event loop
+        await asyncio.to_thread(retrieval.flush_pending, index_name)
 
-        return result
+        # Append to output.jsonl
+        await save_results(results)
+
+        logger.info(f"Successfully processed {len(results)} files")
+
+        return results
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing document: {e}")
+        logger.error(f"Error processing documents: {e}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 
+@app.get("/results", tags=["Processing"])
+async def get_results():
+    """
+    Return the latest processing result for every uploaded file.
+
+    Returns:
+        Dictionary mapping filenames to their most recent result
+    """
+    all_results = {}
+
+    try:
+        async with aiofiles.open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
+            async for line in f:
+                if not line.strip():
+                    continue
+
+                # A concurrent append can leave a partial last line
+                try:
+                    result = json.loads(line)
+                    all_results[result["filename"]] = result
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping unreadable result line: {e}")
+
+        return all_results
+
+    except FileNotFoundError:
+        return all_results
+    except Exception as e:
+        logger.error(f"Error reading results: {e}")
+        raise HTTPException(status_code=500, detail=f"Reading results failed: {str(e)}")
+
+
 @app.post("/search", response_model=SearchResponse, tags=["Search"])
 async def search_documents(request: SearchRequest):
     """
@@ -160,7 +370,8 @@ async def search_documents(request: SearchRequest):
         top_k: Number of results to return
     """
     try:
-        results = retrieval.search(request.index_name, request.query, request.top_k)
+        # Searching may embed queued documents and waits on index updates; keep it off the event loop
+        results = await asyncio.to_thread(retrieval.search, request.index_name, request.query, request.top_k)
 
         if not results:
             return SearchResponse(
@@ -1,11 +1,17 @@
 
 import os
+import asyncio
 import logging
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import faiss
 
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.schema import Document
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from embedding_model import load_embeddings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,22 +21,57 @@ logger = logging.getLogger(__name__)
 class SemanticRetrieval:
     """Simple semantic search using LangChain FAISS."""
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    # Delay before changed indexes are written to disk
+    SAVE_DELAY_SECONDS = 5.0
+
+    # Queued documents are embedded together once this many are waiting,
+    # or after PENDING_DELAY_SECONDS, whichever comes first
+    PENDING_BATCH_SIZE = 64
+    PENDING_DELAY_SECONDS = 0.5
+
+    # A queued batch that fails to index this many times in a row is dropped
+    MAX_FLUSH_ATTEMPTS = 3
+
+    # Embeddings are normalized, so inner product is cosine similarity. Flat
+    # indexes are exact; once they hold HNSW_THRESHOLD vectors they are rebuilt
+    # as HNSW graphs for sublinear search when next saved.
+    HNSW_THRESHOLD = 10000
+    HNSW_NEIGHBORS = 32
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", quantize: bool = False):
         """
         Initialize embeddings.
 
         Args:
             model_name: Sentence transformer model to use
+            quantize: Apply int8 dynamic quantization on CPU (see load_embeddings)
         """
-        logger.info(f"Loading embedding model: {model_name}")
+        self.embeddings = load_embeddings(model_name, quantize)
 
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=model_name,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        # Split documents so each vector fits in MiniLM's input window
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=64)
 
         self.vectorstores: Dict[str, FAISS] = {}
+
+        # Indexes with changes not yet written to disk
+        self._dirty: Set[str] = set()
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+
+        # Documents waiting to be embedded, per index, as (filename, text, digest)
+        self.pending: Dict[str, List[Tuple[str, str, Optional[str]]]] = {}
+
+        # (index_name, filename, digest) of documents already embedded
+        self.indexed: Set[Tuple[str, str, str]] = set()
+        self._pending_handle: Optional[asyncio.TimerHandle] = None
+
+        # Consecutive failed flushes per index
+        self._failed_flushes: Dict[str, int] = {}
+
+        # Timer flushes run in worker threads: _lock serializes index updates,
+        # searches, and saves; _pending_lock guards the pending queues
+        self._lock = threading.RLock()
+        self._pending_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         logger.info("Retrieval system initialized")
 
     def add_document(self, index_name: str, filename: str, text: str):
@@ -42,22 +83,189 @@ class SemanticRetrieval:
             filename: Document filename
             text: Document text content
         """
-        doc = Document(
-            page_content=text,
-            metadata={"filename": filename}
-        )
+        with self._lock:
+            self.add_documents_batch(index_name, [(filename, text)])
+
+    def queue_document(self, index_name: str, filename: str, text: str, digest: Optional[str] = None):
+        """
+        Queue a document to be embedded together with other pending documents.
+
+        A document whose filename and digest are already indexed or queued is skipped.
+
+        Args:
+            index_name: Name of the index
+            filename: Document filename
+            text: Document text content
+            digest: Optional content hash used to skip repeated uploads
+        """
+        with self._pending_lock:
+            if digest is not None:
+                if (index_name, filename, digest) in self.indexed:
+                    return
+                queued = self.pending.get(index_name, [])
+                if any(name == filename and d == digest for name, _, d in queued):
+                    return
+
+            queue = self.pending.setdefault(index_name, [])
+            queue.append((filename, text, digest))
+            batch_full = len(queue) >= self.PENDING_BATCH_SIZE
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_pending(index_name)
+            return
+
+        self._loop = loop
+
+        if batch_full:
+            loop.run_in_executor(None, self.flush_pending, index_name)
+        elif self._pending_handle is None:
+            self._pending_handle = loop.call_later(self.PENDING_DELAY_SECONDS, self._flush_pending_in_background)
+
+    def _flush_pending_in_background(self):
+        """Timer callback that embeds queued documents in a worker thread."""
+        self._pending_handle = None
+        self._loop.run_in_executor(None, self.flush_pending)
+
+    def flush_pending(self, index_name: Optional[str] = None):
+        """
+        Embed and index queued documents.
+
+        Documents are removed from the queue only after they are indexed, so a
+        failed batch is retried on the next flush, up to MAX_FLUSH_ATTEMPTS times.
+
+        Args:
+            index_name: Only flush this index; flush all indexes when None
+        """
+        with self._pending_lock:
+            index_names = [index_name] if index_name is not None else list(self.pending)
+
+        for name in index_names:
+            with self._lock:
+                with self._pending_lock:
+                    items = list(self.pending.get(name, []))
+                if not items:
+                    continue
+
+                try:
+                    self.add_documents_batch(name, [(filename, text) for filename, text, _ in items])
+                    added = items
+                    self._failed_flushes.pop(name, None)
+                except Exception as e:
+                    logger.error(f"Failed to index pending documents for '{name}': {e}")
+
+                    attempts = self._failed_flushes.get(name, 0) + 1
+                    if attempts < self.MAX_FLUSH_ATTEMPTS:
+                        self._failed_flushes[name] = attempts
+                        continue
+
+                    # Stop re-embedding the batch on every upload and search; keep what still indexes
+                    self._failed_flushes.pop(name, None)
+                    added = self._add_individually(name, items)
+
+                with self._pending_lock:
+                    self.indexed.update((name, filename, digest) for filename, _, digest in added if digest is not None)
+
+                    # Documents queued during the add stay for the next flush
+                    queue = self.pending.get(name, [])
+                    del queue[:len(items)]
+                    if not queue:
+                        self.pending.pop(name, None)
+
+    def _add_individually(
+        self,
+        index_name: str,
+        items: List[Tuple[str, str, Optional[str]]]
+    ) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Index queued documents one at a time, dropping the ones that fail.
+
+        Args:
+            index_name: Name of the index
+            items: List of (filename, text, digest) entries
+
+        Returns:
+            The entries that were indexed
+        """
+        added = []
+        for filename, text, digest in items:
+            try:
+                self.add_documents_batch(index_name, [(filename, text)])
+                added.append((filename, text, digest))
+            except Exception as e:
+                logger.error(f"Dropping pending document {filename} for '{index_name}': {e}")
+        return added
+
+    def add_documents_batch(self, index_name: str, items: List[Tuple[str, str]]):
+        """
+        Chunk several documents and add them to the specified index with one embedding call.
+
+        Args:
+            index_name: Name of the index
+            items: List of (filename, text) pairs
+        """
+        texts = []
+        metadatas = []
+        for filename, text in items:
+            for chunk_id, chunk in enumerate(self.text_splitter.split_text(text)):
+                texts.append(chunk)
+                metadatas.append({"filename": filename, "chunk_id": chunk_id})
+
+        if not texts:
+            return
+
+        # One batched forward pass over every chunk instead of one per document
+        text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
 
         if index_name not in self.vectorstores:
             # Create new vector store
-            self.vectorstores[index_name] = FAISS.from_documents([doc], self.embeddings)
+            self.vectorstores[index_name] = FAISS.from_embeddings(
+                text_embeddings,
+                self.embeddings,
+                metadatas=metadatas,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+            )
             logger.info(f"Created new index: {index_name}")
         else:
             # Add to existing vector store
-            self.vectorstores[index_name].add_documents([doc])
-            logger.info(f"Added document to index: {index_name}")
+            self.vectorstores[index_name].add_embeddings(text_embeddings, metadatas=metadatas)
+            logger.info(f"Added {len(items)} document(s) ({len(texts)} chunks) to index: {index_name}")
+
+        self._schedule_save(index_name)
 
-        # Save index
-        self._save_index(index_name)
+    def flush(self):
+        """Index queued documents and save every index with unsaved changes to disk."""
+        self._call_on_loop(self._cancel_timers)
+        self.flush_pending()
+        self._save_dirty()
+
+    def _cancel_timers(self):
+        """Cancel the pending flush and save timers; must run on the event loop thread."""
+        for handle in (self._pending_handle, self._save_handle):
+            if handle is not None:
+                handle.cancel()
+        self._pending_handle = None
+        self._save_handle = None
+
+    def _call_on_loop(self, callback):
+        """Run a callback on the event loop thread, since asyncio handles are not thread-safe."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and self._loop.is_running():
+                self._loop.call_soon_threadsafe(callback)
+                return
+        callback()
+
+    def _save_dirty(self):
+        """Save every index with unsaved changes to disk, rebuilding large ones as HNSW first."""
+        for index_name in list(self._dirty):
+            self._maybe_use_hnsw(index_name)
+
+            with self._lock:
+                self._save_index(index_name)
+                self._dirty.discard(index_name)
 
     def search(self, index_name: str, query: str, top_k: int = 5) -> List[Dict]:
         """
@@ -71,16 +279,20 @@ class SemanticRetrieval:
         Returns:
             List of search results
         """
-        if index_name not in self.vectorstores:
-            logger.warning(f"Index not found: {index_name}")
-            return []
-
         try:
-            # Perform similarity search
-            results = self.vectorstores[index_name].similarity_search_with_score(
-                query,
-                k=top_k
-            )
+            # Make queued documents searchable first
+            self.flush_pending(index_name)
+
+            with self._lock:
+                if index_name not in self.vectorstores:
+                    logger.warning(f"Index not found: {index_name}")
+                    return []
+
+                # Perform similarity search
+                results = self.vectorstores[index_name].similarity_search_with_score(
+                    query,
+                    k=top_k
+                )
 
             # Format results
             formatted_results = []
@@ -99,6 +311,73 @@ class SemanticRetrieval:
             logger.error(f"Search failed: {e}")
             return []
 
+    def _maybe_use_hnsw(self, index_name: str):
+        """
+        Rebuild a large flat inner-product index as an HNSW graph.
+
+        The graph is built without holding the lock, so searches continue on
+        the flat index meanwhile. If documents were added during the rebuild the
+        result is discarded and the rebuild is retried on the next save.
+        """
+        with self._lock:
+            vectorstore = self.vectorstores.get(index_name)
+            if vectorstore is None:
+                return
+            index = vectorstore.index
+
+            if (
+                not isinstance(index, faiss.IndexFlat)
+                or index.metric_type != faiss.METRIC_INNER_PRODUCT
+                or index.ntotal < self.HNSW_THRESHOLD
+            ):
+                return
+
+            vectors = index.reconstruct_n(0, index.ntotal)
+
+        # Re-adding in the same order keeps index_to_docstore_id positions valid
+        hnsw = faiss.IndexHNSWFlat(index.d, self.HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+        hnsw.add(vectors)
+
+        with self._lock:
+            if vectorstore.index is not index or index.ntotal != hnsw.ntotal:
+                return
+            vectorstore.index = hnsw
+
+        logger.info(f"Rebuilt index '{index_name}' as HNSW ({hnsw.ntotal} vectors)")
+
+    def _schedule_save(self, index_name: str):
+        """
+        Mark an index as changed and save it after SAVE_DELAY_SECONDS.
+
+        Saves for changes made within the delay are coalesced into one write.
+        Without an event loop the index is saved immediately.
+        """
+        self._dirty.add(index_name)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from a worker thread; hand the timer back to the server's loop
+            loop = self._loop
+            if loop is None or not loop.is_running():
+                self._save_dirty()
+                return
+            loop.call_soon_threadsafe(self._start_save_timer)
+            return
+
+        self._loop = loop
+        self._start_save_timer()
+
+    def _start_save_timer(self):
+        """Start the save timer on the event loop unless one is already running."""
+        if self._save_handle is None:
+            self._save_handle = self._loop.call_later(self.SAVE_DELAY_SECONDS, self._flush_in_background)
+
+    def _flush_in_background(self):
+        """Timer callback that saves changed indexes in a worker thread."""
+        self._save_handle = None
+        self._loop.run_in_executor(None, self.flush)
+
     def _save_index(self, index_name: str):
         """Save index to disk."""
         if index_name not in self.vectorstores:
@@ -125,11 +404,17 @@ class SemanticRetrieval:
         try:
             index_path = f"data/models/{index_name}"
             if os.path.exists(index_path):
-                self.vectorstores[index_name] = FAISS.load_local(
+                vectorstore = FAISS.load_local(
                     index_path,
                     self.embeddings,
                     allow_dangerous_deserialization=True
                 )
+
+                # Indexes saved before the switch to inner product still use L2
+                if vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                    vectorstore.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+
+                self.vectorstores[index_name] = vectorstore
                 logger.info(f"Loaded index: {index_name}")
                 return True
             return False
@@ -0,0 +1,24 @@
+from typing import List
+
+
+def leading_lines(text: str, count: int = 5) -> List[str]:
+    """
+    Return the first lines of a text without splitting the rest of it.
+
+    Args:
+        text: Text to read lines from
+        count: Maximum number of lines to return
+
+    Returns:
+        Up to count lines, in order
+    """
+    lines = []
+    start = 0
+    while len(lines) < count:
+        end = text.find('\n', start)
+        if end == -1:
+            lines.append(text[start:])
+            break
+        lines.append(text[start:end])
+        start = end + 1
+    return lines